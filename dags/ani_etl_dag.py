@@ -1,8 +1,9 @@
 import pandas as pd
+import pyarrow as pa
 import logging
 import os
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator
 from airflow.decorators import dag, task
 from airflow.models.param import Param
 from airflow.exceptions import AirflowSkipException
@@ -17,13 +18,38 @@ DAG_SCHEDULE = os.environ.get("AIRFLOW_DAG_SCHEDULE", "@daily")
 ENTITY_VALUE = os.environ.get("ANI_ENTITY_VALUE", "Agencia Nacional de Infraestructura")
 VALIDATION_CONFIG_PATH = os.environ.get("VALIDATION_CONFIG_PATH", "/opt/airflow/configs/validation_rules.yml")
 TEMP_DATA_DIR = "/tmp"
+TEMP_BATCH_SIZE = int(os.environ.get("TEMP_BATCH_SIZE", 2048))
+# Extracción: ZSTD (archivo más pequeño, espera a la validación). Validación: LZ4 (lectura inmediata).
+EXTRACTED_COMPRESSION = pa.Codec('zstd', compression_level=3)
+VALIDATED_COMPRESSION = pa.Codec('lz4')
 
 def get_temp_filepath(task_id: str, run_id: str) -> str:
     """Genera una ruta de archivo temporal única por ejecución."""
-    filename = f"{task_id}_{run_id.replace(':', '_')}.parquet"
+    filename = f"{task_id}_{run_id.replace(':', '_')}.feather"
     return os.path.join(TEMP_DATA_DIR, filename)
 
 
+def open_temp_writer(filepath: str, schema: pa.Schema, compression: pa.Codec) -> pa.ipc.RecordBatchFileWriter:
+    """Abre un archivo Feather v2 (Arrow IPC) comprimido para escritura por lotes."""
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return pa.ipc.new_file(filepath, schema, options=options)
+
+
+def write_temp_file(df: pd.DataFrame, filepath: str, compression: pa.Codec) -> None:
+    """Guarda el DataFrame en Feather dividido en record batches de TEMP_BATCH_SIZE filas."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with open_temp_writer(filepath, table.schema, compression) as writer:
+        writer.write_table(table, max_chunksize=TEMP_BATCH_SIZE)
+
+
+def iter_temp_file(filepath: str) -> Iterator[pd.DataFrame]:
+    """Lee un archivo Feather temporal lote a lote, sin cargarlo completo en memoria."""
+    with pa.memory_map(filepath, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for batch_index in range(reader.num_record_batches):
+            yield reader.get_batch(batch_index).to_pandas()
+
+
 def cleanup_temp_files(filepaths: List[str]):
     """Elimina los archivos temporales."""
     for fp in filepaths:
@@ -70,7 +96,7 @@ def ani_etl_pipeline():
 
     @task(task_id="extract_data")
     def task_extract(**kwargs) -> str:
-        """Tarea de Extracción: Scrapea datos y los guarda en un archivo Parquet."""
+        """Tarea de Extracción: Scrapea datos y los guarda en un archivo Feather (por lotes)."""
         run_id = kwargs['dag_run'].run_id
         num_pages = kwargs['params'].get('num_pages', 9)
         log.info(f"Iniciando tarea de extracción para {num_pages} páginas.")
@@ -84,29 +110,43 @@ def ani_etl_pipeline():
             raise AirflowSkipException("No data extracted.")
 
         filepath = get_temp_filepath("extracted", run_id)
-        df.to_parquet(filepath, index=False)
+        write_temp_file(df, filepath, EXTRACTED_COMPRESSION)
         log.info(f"Datos extraídos guardados en: {filepath}")
         return filepath
 
     @task(task_id="validate_data")
     def task_validate(extracted_filepath: str, **kwargs) -> str:
-        """Tarea de Validación: Lee, valida según reglas[cite: 26], y guarda en un nuevo archivo."""
+        """Tarea de Validación: Lee por lotes, valida según reglas[cite: 26], y guarda en un nuevo archivo."""
         run_id = kwargs['dag_run'].run_id
         log.info(f"Iniciando tarea de validación desde el archivo: {extracted_filepath}")
 
-        df = pd.read_parquet(extracted_filepath)
         rules = load_rules(VALIDATION_CONFIG_PATH)
-        validated_df = validate_data(df, rules)
+        validated_filepath = get_temp_filepath("validated", run_id)
+        total_count, valid_count = 0, 0
+        writer, schema = None, None
+        try:
+            for chunk in iter_temp_file(extracted_filepath):
+                validated_chunk = validate_data(chunk, rules)
+                total_count += len(chunk)
+                valid_count += len(validated_chunk)
+                if validated_chunk.empty:
+                    continue
+                table = pa.Table.from_pandas(validated_chunk, schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = open_temp_writer(validated_filepath, schema, VALIDATED_COMPRESSION)
+                writer.write_table(table, max_chunksize=TEMP_BATCH_SIZE)
+        finally:
+            if writer is not None:
+                writer.close()
 
         # Log de descartes
-        descartes = len(df) - len(validated_df)
+        descartes = total_count - valid_count
         log.info(f"--- DESCARTES POR VALIDACIÓN: {descartes} ---")
 
-        if validated_df.empty:
+        if valid_count == 0:
             raise AirflowSkipException("No valid data left after validation.")
 
-        validated_filepath = get_temp_filepath("validated", run_id)
-        validated_df.to_parquet(validated_filepath, index=False)
         log.info(f"Datos validados guardados en: {validated_filepath}")
         return validated_filepath
 
@@ -115,8 +155,12 @@ def ani_etl_pipeline():
         """Tarea de Escritura: Inserta en BD (con idempotencia)  y limpia archivos."""
         log.info(f"Iniciando tarea de escritura desde el archivo: {validated_filepath}")
 
-        df = pd.read_parquet(validated_filepath)
-        result = write_data(df, entity=ENTITY_VALUE)
+        records_inserted, messages = 0, []
+        for chunk in iter_temp_file(validated_filepath):
+            chunk_result = write_data(chunk, entity=ENTITY_VALUE)
+            records_inserted += chunk_result.get('records_inserted', 0)
+            messages.append(chunk_result.get('message', ''))
+        result = {'records_inserted': records_inserted, 'message': ' | '.join(messages)}
 
         # Log de filas insertadas
         log.info(f"--- FILAS INSERTADAS: {result.get('records_inserted', 0)} ---")
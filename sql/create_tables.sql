@@ -19,4 +19,7 @@ CREATE TABLE IF NOT EXISTS regulations_component (
     components_id INTEGER,
 
     UNIQUE (regulations_id, components_id)
-);
\ No newline at end of file
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS regulations_uq
+    ON regulations (entity, title, created_at, COALESCE(external_link, ''));
@@ -1,8 +1,13 @@
+import ahocorasick
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import re
 import pandas as pd
 from bs4 import BeautifulSoup
+import soupsieve
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import os
@@ -25,55 +30,71 @@ except json.JSONDecodeError as e:
 
 FIXED_CLASSIFICATION_ID = int(os.environ.get("ANI_FIXED_CLASSIFICATION_ID", 13))
 DEFAULT_RTYPE_ID = int(os.environ.get("ANI_DEFAULT_RTYPE_ID", 14))
+SCRAPER_MAX_WORKERS = int(os.environ.get("ANI_SCRAPER_MAX_WORKERS", 8))
+
+
+def create_session(pool_size: int = 16) -> requests.Session:
+    """Crea una sesión HTTP con pool de conexiones keep-alive y reintentos."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=Retry(total=3, backoff_factor=0.5))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+SESSION = create_session()
+
+QUOTES_TRANSLATION = str.maketrans('', '', '\u201C\u201D\u2018\u2019\u00AB\u00BB\u201E\u201A\u2039\u203A"\'´`\u2032\u2033')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
 
 def clean_quotes(text: Optional[str]) -> Optional[str]:
     """Elimina varios tipos de comillas y espacios extra de un texto."""
     if not text:
         return text
-    quotes_map = {
-        '\u201C': '', '\u2018': '', '\u2019': '', '\u00AB': '', '\u00BB': '',
-        '\u201E': '', '\u201A': '', '\u2039': '', '\u203A': '', '"': '',
-        "'": '', '´': '', '`': '', '′': '', '″': '',
-    }
-    cleaned_text = text
-    for quote_char, replacement in quotes_map.items():
-        cleaned_text = cleaned_text.replace(quote_char, replacement)
-    quotes_pattern = r'["\'\u201C\u201D\u2018\u2019\u00AB\u00BB\u201E\u201A\u2039\u203A\u2032\u2033]'
-    cleaned_text = re.sub(quotes_pattern, '', cleaned_text)
-    cleaned_text = cleaned_text.strip()
-    cleaned_text = ' '.join(cleaned_text.split())
-    return cleaned_text
+    return WHITESPACE_PATTERN.sub(' ', text.translate(QUOTES_TRANSLATION)).strip()
+
+
+def build_keyword_automaton(keywords: Dict[str, int]) -> Optional[ahocorasick.Automaton]:
+    """Construye un autómata Aho-Corasick con las palabras clave, conservando su orden de prioridad."""
+    automaton = ahocorasick.Automaton()
+    for priority, (keyword, rtype_id) in enumerate(keywords.items()):
+        # Títulos y palabras clave se comparan en minúsculas; si dos claves colisionan, gana la primera
+        if keyword and keyword.lower() not in automaton:
+            automaton.add_word(keyword.lower(), (priority, rtype_id))
+    if len(automaton) == 0:
+        return None
+    automaton.make_automaton()
+    return automaton
+
+
+KEYWORD_AUTOMATON = build_keyword_automaton(CLASSIFICATION_KEYWORDS)
 
 
 def get_rtype_id(title: str) -> int:
     """Obtiene el rtype_id basado en el título del documento."""
-    title_lower = title.lower()
-    for keyword, rtype_id in CLASSIFICATION_KEYWORDS.items():
-        if keyword in title_lower:
-            return rtype_id
-    return DEFAULT_RTYPE_ID
+    if KEYWORD_AUTOMATON is None:
+        return DEFAULT_RTYPE_ID
+    matches = [value for _, value in KEYWORD_AUTOMATON.iter(title.lower())]
+    if not matches:
+        return DEFAULT_RTYPE_ID
+    # Se respeta el orden de ANI_RTYPE_KEYWORDS: gana la primera palabra clave definida
+    return min(matches)[1]
 
 
-def is_valid_created_at(created_at_value: Any) -> bool:
-    """Valida el campo created_at."""
-    if not created_at_value:
-        return False
-    if isinstance(created_at_value, str):
-        return bool(created_at_value.strip())
-    if isinstance(created_at_value, datetime):
-        return True
-    return False
+# Selectores CSS precompilados, reutilizados en todas las filas
+TITLE_LINK_SELECTOR = soupsieve.compile('td.views-field-title a')
+SUMMARY_CELL_SELECTOR = soupsieve.compile('td.views-field-body')
+DATE_SPAN_SELECTOR = soupsieve.compile('td.views-field-field-fecha--1 span.date-display-single')
+DATE_CELL_SELECTOR = soupsieve.compile('td.views-field-field-fecha--1')
 
 
 def extract_title_and_link(row: Any, norma_data: Dict[str, Any], verbose: bool, row_num: int) -> bool:
     """Extrae título y enlace. Contiene la lógica de omisión original. """
-    title_cell = row.find('td', class_='views-field views-field-title')
-    if not title_cell:
-        if verbose: log.warning(f"No se encontró celda de título en la fila {row_num}. Saltando.")
-        return False
-    title_link = title_cell.find('a')
+    title_link = TITLE_LINK_SELECTOR.select_one(row)
     if not title_link:
-        if verbose: log.warning(f"No se encontró enlace en la fila {row_num}. Saltando.")
+        if verbose: log.warning(f"No se encontró celda de título con enlace en la fila {row_num}. Saltando.")
         return False
     raw_title = title_link.get_text(strip=True)
     cleaned_title = clean_quotes(raw_title)
@@ -94,7 +115,7 @@ def extract_title_and_link(row: Any, norma_data: Dict[str, Any], verbose: bool,
 
 def extract_summary(row: Any, norma_data: Dict[str, Any]):
     """Extrae el resumen/descripción de una fila."""
-    summary_cell = row.find('td', class_='views-field views-field-body')
+    summary_cell = SUMMARY_CELL_SELECTOR.select_one(row)
     if summary_cell:
         raw_summary = summary_cell.get_text(strip=True)
         cleaned_summary = clean_quotes(raw_summary)
@@ -104,91 +125,114 @@ def extract_summary(row: Any, norma_data: Dict[str, Any]):
         norma_data['summary'] = None
 
 
-def extract_creation_date(row: Any, norma_data: Dict[str, Any], verbose: bool, row_num: int) -> bool:
-    """Extrae la fecha de creación. Contiene la lógica de validación/omisión original. """
-    fecha_cell = row.find('td', class_='views-field views-field-field-fecha--1')
-    if fecha_cell:
-        fecha_span = fecha_cell.find('span', class_='date-display-single')
-        if fecha_span:
-            created_at_raw = fecha_span.get('content', fecha_span.get_text(strip=True))
-            if 'T' in created_at_raw:
-                norma_data['created_at'] = created_at_raw.split('T')[0]
-            elif '/' in created_at_raw:
-                try:
-                    day, month, year = created_at_raw.split('/')
-                    norma_data['created_at'] = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-                except:
-                    norma_data['created_at'] = created_at_raw
-            else:
-                norma_data['created_at'] = created_at_raw
-        else:
-            norma_data['created_at'] = fecha_cell.get_text(strip=True)
-    else:
-        norma_data['created_at'] = None
-    if not is_valid_created_at(norma_data['created_at']):
-        if verbose: log.warning(f"Saltando norma '{norma_data.get('title')}' por fecha inválida.")
-        return False
-    return True
+def extract_creation_date(row: Any, norma_data: Dict[str, Any]):
+    """Extrae la fecha de creación sin normalizar (ver normalize_created_at)."""
+    fecha_span = DATE_SPAN_SELECTOR.select_one(row)
+    if fecha_span:
+        norma_data['created_at_raw'] = fecha_span.get('content') or fecha_span.get_text(strip=True)
+        return
+    fecha_cell = DATE_CELL_SELECTOR.select_one(row)
+    norma_data['created_at_raw'] = fecha_cell.get_text(strip=True) if fecha_cell else None
+
+
+def normalize_created_at(created_at_raw: pd.Series) -> pd.Series:
+    """Normaliza la columna de fechas a 'YYYY-MM-DD' (acepta ISO 8601 y DD/MM/YYYY); lo inválido queda nulo."""
+    date_part = created_at_raw.astype('string').str.split('T').str[0].str.strip()
+    iso_dates = pd.to_datetime(date_part, errors='coerce', format='%Y-%m-%d')
+    dmy_dates = pd.to_datetime(date_part, errors='coerce', format='%d/%m/%Y')
+    return iso_dates.fillna(dmy_dates).dt.strftime('%Y-%m-%d')
+
+
+SCRAPED_COLUMNS = ('created_at_raw', 'title', 'gtype', 'external_link', 'rtype_id', 'summary')
+OUTPUT_COLUMNS = ['created_at', 'update_at', 'is_active', 'title', 'gtype', 'entity', 'external_link', 'rtype_id',
+                  'summary', 'classification_id']
 
 
-def scrape_page(page_num: int, verbose: bool = False) -> List[Dict[str, Any]]:
-    """Scrapea una página específica de ANI."""
+def empty_columns() -> Dict[str, List[Any]]:
+    """Estructura por columnas (una lista por campo scrapeado)."""
+    return {column: [] for column in SCRAPED_COLUMNS}
+
+
+def scrape_page(page_num: int, verbose: bool = False,
+                session: Optional[requests.Session] = None) -> Dict[str, List[Any]]:
+    """Scrapea una página específica de ANI. Devuelve los datos por columnas (SCRAPED_COLUMNS)."""
+    session = session or SESSION
     if page_num == 0:
         page_url = URL_BASE
     else:
         page_url = f"{URL_BASE}&page={page_num}"
     if verbose: log.info(f"Scrapeando página {page_num}: {page_url}")
     try:
-        response = requests.get(page_url, timeout=15)
+        response = session.get(page_url, timeout=15)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, 'lxml')
         tbody = soup.find('tbody')
         if not tbody:
             if verbose: log.info(f"No se encontró tabla en página {page_num}")
-            return []
+            return empty_columns()
         rows = tbody.find_all('tr')
         if verbose: log.info(f"Encontradas {len(rows)} filas en página {page_num}")
-        page_data = []
+        page_columns = empty_columns()
         for i, row in enumerate(rows, 1):
             try:
-                norma_data = {
-                    'created_at': None, 'update_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'is_active': True, 'title': None, 'gtype': None, 'entity': ENTITY_VALUE,
-                    'external_link': None, 'rtype_id': None, 'summary': None,
-                    'classification_id': FIXED_CLASSIFICATION_ID,
-                }
+                norma_data = {'created_at_raw': None, 'title': None, 'gtype': None, 'external_link': None,
+                              'summary': None}
                 if not extract_title_and_link(row, norma_data, verbose, i): continue
                 extract_summary(row, norma_data)
-                if not extract_creation_date(row, norma_data, verbose, i): continue
+                extract_creation_date(row, norma_data)
                 norma_data['rtype_id'] = get_rtype_id(norma_data['title'])
-                page_data.append(norma_data)
+                for column in SCRAPED_COLUMNS:
+                    page_columns[column].append(norma_data[column])
             except Exception as e:
                 if verbose: log.error(f"Error procesando fila {i}: {str(e)}")
                 continue
-        return page_data
+        return page_columns
     except requests.RequestException as e:
         log.error(f"Error HTTP en página {page_num}: {e}")
-        return []
+        return empty_columns()
     except Exception as e:
         log.error(f"Error procesando página {page_num}: {e}")
-        return []
+        return empty_columns()
 
 def extract_data(num_pages_to_scrape: int) -> pd.DataFrame:
     """Función principal de extracción que el DAG llamará."""
     log.info(f"Iniciando extracción de {num_pages_to_scrape} páginas...")
-    all_normas_data = []
-    for page_num in range(num_pages_to_scrape):
+    all_columns = empty_columns()
+
+    def scrape_page_safe(page_num: int) -> Dict[str, List[Any]]:
         log.info(f"Procesando página {page_num}...")
         try:
-            page_data = scrape_page(page_num, verbose=True)
-            all_normas_data.extend(page_data)
+            return scrape_page(page_num, verbose=True, session=SESSION)
         except Exception as e:
             log.error(f"Error procesando página {page_num}: {e}", exc_info=True)
+            return empty_columns()
 
-    if not all_normas_data:
+    max_workers = max(1, min(SCRAPER_MAX_WORKERS, num_pages_to_scrape))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_columns in executor.map(scrape_page_safe, range(num_pages_to_scrape)):
+            for column in SCRAPED_COLUMNS:
+                all_columns[column].extend(page_columns[column])
+
+    if not all_columns['title']:
         log.warning("No se encontraron datos en el scraping.")
         return pd.DataFrame()
 
-    df_normas = pd.DataFrame(all_normas_data)
+    df_normas = pd.DataFrame(all_columns)
+    df_normas['created_at'] = normalize_created_at(df_normas['created_at_raw'])
+    invalid_dates = df_normas['created_at'].isna()
+    if invalid_dates.any():
+        log.warning(f"Saltando {int(invalid_dates.sum())} normas por fecha inválida: "
+                    f"{df_normas.loc[invalid_dates, 'title'].tolist()}")
+        df_normas = df_normas[~invalid_dates].reset_index(drop=True)
+    if df_normas.empty:
+        log.warning("No se encontraron datos con fecha válida en el scraping.")
+        return pd.DataFrame()
+
+    # Campos constantes: se asignan una sola vez a toda la columna
+    df_normas['update_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    df_normas['is_active'] = True
+    df_normas['entity'] = ENTITY_VALUE
+    df_normas['classification_id'] = FIXED_CLASSIFICATION_ID
+    df_normas = df_normas[OUTPUT_COLUMNS]
     log.info(f"Extracción completa. Total registros extraídos: {len(df_normas)}")
-    return df_normas
\ No newline at end of file
+    return df_normas
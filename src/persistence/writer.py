@@ -1,9 +1,13 @@
 import pandas as pd
+import numpy as np
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import threading
 import os
+import math
 import logging
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Union
 
 log = logging.getLogger(__name__)
 
@@ -11,6 +15,29 @@ DB_REGULATIONS_TABLE_NAME = os.environ.get("DB_REGULATIONS_TABLE_NAME", "regulat
 DB_COMPONENTS_TABLE_NAME = os.environ.get("DB_COMPONENTS_TABLE_NAME", "regulations_component")
 DEFAULT_COMPONENT_ID = int(os.environ.get("DEFAULT_COMPONENT_ID", 7))
 DB_SCHEMA_FILE_PATH = os.environ.get("DB_SCHEMA_FILE_PATH", "/opt/airflow/sql/create_tables.sql")
+DB_INSERT_CHUNK_SIZE = int(os.environ.get("DB_INSERT_CHUNK_SIZE", 2000))
+DB_POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX_CONNECTIONS", 4))
+
+CONNECTION_POOL: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+CONNECTION_POOL_LOCK = threading.Lock()
+
+
+def get_connection_pool(**connection_kwargs: Any) -> psycopg2.pool.ThreadedConnectionPool:
+    """Crea (una sola vez por proceso) el pool de conexiones compartido por los DatabaseManager."""
+    global CONNECTION_POOL
+    with CONNECTION_POOL_LOCK:
+        if CONNECTION_POOL is None or CONNECTION_POOL.closed:
+            CONNECTION_POOL = psycopg2.pool.ThreadedConnectionPool(1, DB_POOL_MAX_CONNECTIONS, **connection_kwargs)
+        return CONNECTION_POOL
+
+
+def to_db_value(value: Any) -> Any:
+    """Traduce nulos (NaN, NaT, pd.NA) a None y escalares NumPy a tipos nativos para psycopg2."""
+    if value is pd.NA or value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
 
 
 class DatabaseManager:
@@ -27,23 +54,31 @@ class DatabaseManager:
         self.db_port = os.environ.get("POSTGRES_PORT", "5432")
 
     def connect(self) -> bool:
-        """Conecta a la BD Postgres, reemplazando Secrets Manager[cite: 31]."""
+        """Obtiene una conexión del pool a la BD Postgres, reemplazando Secrets Manager[cite: 31]."""
         try:
-            self.connection = psycopg2.connect(
+            pool = get_connection_pool(
                 dbname=self.db_name, user=self.db_user,
                 password=self.db_pass, host=self.db_host, port=self.db_port
             )
+            self.connection = pool.getconn()
             self.cursor = self.connection.cursor()
             log.info(f"Conectado exitosamente a la base de datos en {self.db_host}")
             return True
-        except psycopg2.OperationalError as e:
+        except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
             log.error(f"Error de conexión a la base de datos: {e}")
             return False
 
     def close(self):
+        """Devuelve la conexión al pool (o la cierra si el pool ya no existe)."""
         if self.cursor: self.cursor.close()
-        if self.connection: self.connection.close()
-        log.info("Conexión a la base de datos cerrada.")
+        if self.connection and CONNECTION_POOL is not None and not CONNECTION_POOL.closed:
+            CONNECTION_POOL.putconn(self.connection)
+            log.info("Conexión a la base de datos devuelta al pool.")
+        elif self.connection:
+            self.connection.close()
+            log.info("Conexión a la base de datos cerrada.")
+        self.cursor = None
+        self.connection = None
 
     def ensure_schema_exists(self) -> None:
         """Ejecuta el DDL (CREATE TABLE IF NOT EXISTS)."""
@@ -70,20 +105,37 @@ class DatabaseManager:
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
-    def bulk_insert(self, df: pd.DataFrame, table_name: str) -> int:
-        """Inserción masiva. Lógica original de lambda.py."""
+    def bulk_insert(self, df: pd.DataFrame, table_name: str,
+                    returning: Optional[str] = None) -> Union[int, List[Any]]:
+        """Inserción masiva idempotente (INSERT ... ON CONFLICT DO NOTHING) vía execute_values,
+        en lotes de DB_INSERT_CHUNK_SIZE filas y con un único commit al final.
+
+        Si se indica `returning`, devuelve los valores de esa columna para las filas realmente
+        insertadas; en caso contrario devuelve el número de filas enviadas.
+        """
         if not self.connection or not self.cursor:
             raise Exception("Database not connected")
         try:
-            df = df.astype(object).where(pd.notnull(df), None)
             columns_for_sql = ", ".join([f'"{col}"' for col in df.columns])
-            placeholders = ", ".join(["%s"] * len(df.columns))
-            insert_query = f"INSERT INTO {table_name} ({columns_for_sql}) VALUES ({placeholders})"
-            records_to_insert = [tuple(x) for x in df.values]
-            psycopg2.extras.execute_batch(self.cursor, insert_query, records_to_insert)
-            inserted_count = len(records_to_insert)
+            insert_query = f"INSERT INTO {table_name} ({columns_for_sql}) VALUES %s ON CONFLICT DO NOTHING"
+            if returning:
+                insert_query += f' RETURNING "{returning}"'
+            returned_values: List[Any] = []
+            for start in range(0, len(df), DB_INSERT_CHUNK_SIZE):
+                chunk = df.iloc[start:start + DB_INSERT_CHUNK_SIZE]
+                records_to_insert = (tuple(to_db_value(value) for value in row)
+                                     for row in chunk.itertuples(index=False, name=None))
+                returned_rows = psycopg2.extras.execute_values(self.cursor, insert_query, records_to_insert,
+                                                               page_size=DB_INSERT_CHUNK_SIZE, fetch=bool(returning))
+                if returning:
+                    returned_values.extend(row[0] for row in returned_rows)
             self.connection.commit()
-            log.info(f"Bulk insert en '{table_name}' exitoso. Filas afectadas: {inserted_count}")
+            if returning:
+                log.info(f"Bulk insert en '{table_name}' exitoso. Filas insertadas: {len(returned_values)} "
+                         f"(omitidas por conflicto: {len(df) - len(returned_values)})")
+                return returned_values
+            inserted_count = len(df)
+            log.info(f"Bulk insert en '{table_name}' exitoso. Filas enviadas: {inserted_count}")
             return inserted_count
         except Exception as e:
             self.connection.rollback()
@@ -91,7 +143,6 @@ class DatabaseManager:
             raise
 
 
-
 def insert_regulations_component(db_manager: DatabaseManager, new_ids: List[int]) -> Tuple[int, str]:
     """Inserto componente. Lógica original de lambda.py."""
     if not new_ids:
@@ -99,7 +150,7 @@ def insert_regulations_component(db_manager: DatabaseManager, new_ids: List[int]
     try:
         id_rows = pd.DataFrame(new_ids, columns=['regulations_id'])
         id_rows['components_id'] = DEFAULT_COMPONENT_ID
-        inserted_count = db_manager.bulk_insert(id_rows, DB_COMPONENTS_TABLE_NAME)
+        inserted_count = len(db_manager.bulk_insert(id_rows, DB_COMPONENTS_TABLE_NAME, returning='id'))
         msg = f"Successfully inserted {inserted_count} regulation components"
         log.info(msg)
         return inserted_count, msg
@@ -110,85 +161,44 @@ def insert_regulations_component(db_manager: DatabaseManager, new_ids: List[int]
 
 
 def insert_new_records(db_manager: DatabaseManager, df: pd.DataFrame, entity: str) -> Tuple[int, str]:
-    """Inserta nuevos registros evitando duplicados. Lógica original de lambda.py."""
+    """Inserta nuevos registros evitando duplicados. La detección contra la BD la resuelve Postgres
+    (índice único + ON CONFLICT DO NOTHING)."""
     regulations_table_name = DB_REGULATIONS_TABLE_NAME
     try:
-        query = f"SELECT title, created_at, entity, COALESCE(external_link, '') as external_link FROM {regulations_table_name} WHERE entity = %s"
-        existing_records = db_manager.execute_query(query, (entity,))
-        db_df = pd.DataFrame(existing_records, columns=['title', 'created_at', 'entity',
-                                                        'external_link']) if existing_records else pd.DataFrame(
-            columns=['title', 'created_at', 'entity', 'external_link'])
-        log.info(f"Registros existentes en BD para {entity}: {len(db_df)}")
-
         entity_df = df[df['entity'] == entity].copy()
         if entity_df.empty: return 0, f"No records found for entity {entity}"
         log.info(f"Registros a procesar para {entity}: {len(entity_df)}")
 
-        if not db_df.empty:
-            db_df['created_at'] = db_df['created_at'].astype(str)
-            db_df['external_link'] = db_df['external_link'].fillna('').astype(str)
-            db_df['title'] = db_df['title'].astype(str).str.strip()
-        entity_df['created_at'] = entity_df['created_at'].astype(str)
-        entity_df['external_link'] = entity_df['external_link'].fillna('').astype(str)
-        entity_df['title'] = entity_df['title'].astype(str).str.strip()
+        for col in ('title', 'created_at', 'external_link'):
+            entity_df[col] = entity_df[col].astype('string[pyarrow]').fillna('').str.strip()
 
         log.info("=== INICIANDO VALIDACIÓN DE DUPLICADOS OPTIMIZADA ===")
-        if db_df.empty:
-            new_records = entity_df.copy()
-            duplicates_found = 0
-            log.info("No hay registros existentes, todos son nuevos")
-        else:
-            entity_df['unique_key'] = entity_df['title'] + '|' + entity_df['created_at'] + '|' + entity_df[
-                'external_link']
-            db_df['unique_key'] = db_df['title'] + '|' + db_df['created_at'] + '|' + db_df['external_link']
-            existing_keys = set(db_df['unique_key'])
-            entity_df['is_duplicate'] = entity_df['unique_key'].isin(existing_keys)
-            new_records = entity_df[~entity_df['is_duplicate']].copy()
-            duplicates_found = len(entity_df) - len(new_records)
-            if duplicates_found > 0: log.info(f"Duplicados encontrados: {duplicates_found}")
-
-        len_before_internal_dedup = len(new_records)
-        new_records = new_records.drop_duplicates(subset=['title', 'created_at', 'external_link'], keep='first')
-        internal_duplicates = len_before_internal_dedup - len(new_records)
+        new_records = entity_df.drop_duplicates(subset=['title', 'created_at', 'external_link'], keep='first')
+        internal_duplicates = len(entity_df) - len(new_records)
         if internal_duplicates > 0: log.info(f"Duplicados internos removidos: {internal_duplicates}")
-        total_duplicates = duplicates_found + internal_duplicates
-        log.info(f"=== DUPLICADOS IDENTIFICADOS: {total_duplicates} ===")
-        if new_records.empty:
-            return 0, f"No new records found for entity {entity} after duplicate validation"
 
         db_columns = ['created_at', 'update_at', 'is_active', 'title', 'gtype', 'entity', 'external_link', 'rtype_id',
                       'summary', 'classification_id']
         df_to_insert = new_records[[col for col in db_columns if col in new_records.columns]]
         log.info(f"Registros finales a insertar: {len(df_to_insert)}")
 
-        total_rows_processed = 0
-        try:
-            total_rows_processed = db_manager.bulk_insert(df_to_insert, regulations_table_name)
-            if total_rows_processed == 0: return 0, f"No records were actually inserted for entity {entity}"
-            log.info(f"Registros insertados exitosamente: {total_rows_processed}")
-        except Exception as insert_error:
-            log.error(f"Error en inserción: {insert_error}", exc_info=True)
-            if "duplicate" in str(insert_error).lower() or "unique" in str(insert_error).lower():
-                log.warning("Error de duplicados detectado - algunos registros ya existían")
-                return 0, f"Some records for entity {entity} were duplicates and skipped"
-            else:
-                raise insert_error
-
-        log.info("=== OBTENIENDO IDS DE REGISTROS INSERTADOS ===")
-        new_ids_query = f"SELECT id FROM {regulations_table_name} WHERE entity = %s ORDER BY id DESC LIMIT %s"
-        new_ids_result = db_manager.execute_query(new_ids_query, (entity, total_rows_processed))
-        new_ids = [row[0] for row in new_ids_result]
-        log.info(f"IDs obtenidos: {len(new_ids)}")
+        new_ids = db_manager.bulk_insert(df_to_insert, regulations_table_name, returning='id')
+        total_rows_processed = len(new_ids)
+        existing_duplicates = len(df_to_insert) - total_rows_processed
+        total_duplicates = internal_duplicates + existing_duplicates
+        log.info(f"=== DUPLICADOS IDENTIFICADOS: {total_duplicates} ===")
+        if total_rows_processed == 0:
+            return 0, f"No new records found for entity {entity} after duplicate validation"
+        log.info(f"Registros insertados exitosamente: {total_rows_processed}")
 
         component_message = ""
-        if new_ids:
-            try:
-                _, component_message = insert_regulations_component(db_manager, new_ids)
-            except Exception as comp_error:
-                log.error(f"Error insertando componentes: {comp_error}", exc_info=True)
-                component_message = f"Error inserting components: {str(comp_error)}"
-
-        stats = f"Processed: {len(entity_df)} | Existing: {len(db_df)} | Duplicates skipped: {total_duplicates} | New inserted: {total_rows_processed}"
+        try:
+            _, component_message = insert_regulations_component(db_manager, new_ids)
+        except Exception as comp_error:
+            log.error(f"Error insertando componentes: {comp_error}", exc_info=True)
+            component_message = f"Error inserting components: {str(comp_error)}"
+
+        stats = f"Processed: {len(entity_df)} | Duplicates skipped: {total_duplicates} | New inserted: {total_rows_processed}"
         message = f"Entity {entity}: {stats}. {component_message}"
         log.info(f"=== RESULTADO FINAL ===\n{message}")
 
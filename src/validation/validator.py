@@ -2,19 +2,35 @@ import pandas as pd
 import yaml
 import logging
 import re
-from pydantic import BaseModel, create_model, field_validator, ValidationError, ConfigDict
-from typing import Dict, Any, List, Optional, Type
+import os
+import copy
+import json
+import functools
+from typing import Dict, Any
 
 log = logging.getLogger(__name__)
 
+# Valores aceptados para campos 'bool' (1/0 como en el modo lax de Pydantic); el resto queda nulo
+BOOL_VALUES = {True: True, False: False, 1: True, 0: False}
+
+
+@functools.lru_cache(maxsize=1)
+def read_rules_file(config_path: str, modified_at: float) -> Dict[str, Any]:
+    """Lee y parsea el YAML de reglas; cacheado por ruta y fecha de modificación."""
+    with open(config_path, 'r') as f:
+        rules = yaml.safe_load(f)
+    log.info(f"Reglas de validación cargadas desde {config_path}")
+    return rules
+
 
 def load_rules(config_path: str) -> Dict[str, Any]:
-    """Carga las reglas de validación desde un archivo YAML[cite: 26]."""
+    """Carga las reglas de validación desde un archivo YAML[cite: 26]. Solo se vuelve a parsear
+    si el archivo cambió; las regex quedan precompiladas en el plan de validación."""
     try:
-        with open(config_path, 'r') as f:
-            rules = yaml.safe_load(f)
-            log.info(f"Reglas de validación cargadas desde {config_path}")
-            return rules
+        rules = read_rules_file(config_path, os.path.getmtime(config_path))
+        get_validation_plan(rules)
+        # Copia para que ningún llamador pueda alterar las reglas cacheadas
+        return copy.deepcopy(rules)
     except FileNotFoundError:
         log.error(f"Archivo de reglas {config_path} no encontrado.", exc_info=True)
         raise
@@ -23,88 +39,78 @@ def load_rules(config_path: str) -> Dict[str, Any]:
         raise
 
 
-def create_dynamic_validator(rules: Dict[str, Any]) -> Type[BaseModel]:
-    """Crea un modelo Pydantic dinámicamente basado en las reglas del YAML."""
-
-    class ArbitraryConfig:
-        arbitrary_types_allowed = True
+def coerce_column(series: pd.Series, field_type: str) -> pd.Series:
+    """Convierte una columna completa al tipo declarado en el YAML; los valores inválidos quedan nulos."""
+    if field_type == 'date':
+        return pd.to_datetime(series, errors='coerce')
+    if field_type == 'int':
+        numeric = pd.to_numeric(series, errors='coerce')
+        return numeric.where(numeric % 1 == 0).astype('Int64')
+    if field_type == 'bool':
+        return series.map(BOOL_VALUES).astype('boolean')
+    if field_type == 'str':
+        return series.astype('string')
+    return series
 
-    field_definitions: Dict[str, Any] = {}
-    validators: Dict[str, Any] = {}
-    type_map = {'str': (Optional[str], None), 'int': (Optional[int], None), 'bool': (Optional[bool], None),
-                'date': (Optional[pd.Timestamp], None)}
 
-    # 1. Definir tipos de campos 
-    for field, field_type in rules.get('types', {}).items():
-        field_definitions[field] = type_map.get(field_type, (Optional[Any], None))
+@functools.lru_cache(maxsize=4)
+def compile_validation_plan(rules_key: str) -> Dict[str, Any]:
+    """Compila (una sola vez por conjunto de reglas) los campos obligatorios, tipos y regex."""
+    rules = json.loads(rules_key)
+    return {
+        'required': tuple(rules.get('required', [])),
+        'types': tuple(rules.get('types', {}).items()),
+        'regex': tuple((field, re.compile(pattern)) for field, pattern in rules.get('regex', {}).items()),
+    }
 
-    # 2. Definir validadores de Regex
-    for field, pattern in rules.get('regex', {}).items():
-        def create_regex_validator(pattern=pattern):
-            @field_validator(field, check_fields=False)
-            @classmethod
-            def validate_regex(cls, v: Optional[str]) -> Optional[str]:
-                if v is None: return v
-                if not re.match(pattern, str(v)):
-                    raise ValueError(f"No cumple el patrón regex: {pattern}")
-                return v
 
-            return validate_regex
-
-        validators[f"validate_regex_{field}"] = create_regex_validator()
-
-    return create_model('DynamicRegulationModel',__config__=ConfigDict(arbitrary_types_allowed=True),**field_definitions,__validators__=validators)
+def get_validation_plan(rules: Dict[str, Any]) -> Dict[str, Any]:
+    """Obtiene el plan de validación compilado para las reglas dadas (cacheado)."""
+    return compile_validation_plan(json.dumps(rules, sort_keys=True))
 
 
 def validate_data(df: pd.DataFrame, rules: Dict[str, Any]) -> pd.DataFrame:
-    """Función principal de validación. Implementa la lógica de descarte/anulación."""
+    """Función principal de validación. Implementa la lógica de descarte/anulación por columnas."""
     if df.empty:
         log.warning("DataFrame vacío, omitiendo validación.")
         return df
 
     original_count = len(df)
     log.info(f"Iniciando validación de {original_count} registros...")
-    DynamicModel = create_dynamic_validator(rules)
-    required_fields = rules.get('required', [])
-    validated_rows: List[Dict[str, Any]] = []
-    discarded_row_count = 0
-
-    if 'created_at' in df.columns: df['created_at'] = pd.to_datetime(df['created_at'], errors='coerce')
-    if 'rtype_id' in df.columns: df['rtype_id'] = pd.to_numeric(df['rtype_id'], errors='coerce')
-
-    records = df.to_dict('records')
-
-    for i, row in enumerate(records):
-        missing_required = [field for field in required_fields if pd.isna(row.get(field))]
-        if missing_required:
-            log.warning(
-                f"Fila {i} (Titulo: {row.get('title')}) descartada. Faltan campos obligatorios: {missing_required}")
-            discarded_row_count += 1
+    df = df.copy()
+    plan = get_validation_plan(rules)
+    required_fields = plan['required']
+
+    # 1. Coerción de tipos (valores no convertibles quedan nulos)
+    for field, field_type in plan['types']:
+        if field in df.columns:
+            df[field] = coerce_column(df[field], field_type)
+
+    # 2. Regex: se anulan las celdas que no cumplen el patrón
+    for field, compiled in plan['regex']:
+        if field not in df.columns:
+            continue
+        matches = df[field].astype('string').str.match(compiled).fillna(False).astype(bool)
+        invalid = ~matches & df[field].notna()
+        invalid_count = int(invalid.sum())
+        if invalid_count:
+            log.warning(f"Anulando {invalid_count} valores de '{field}' que no cumplen el patrón regex: {compiled.pattern}")
+            df.loc[invalid, field] = None
+
+    # 3. Campos obligatorios (incluye los anulados por regex)
+    required_ok = pd.Series(True, index=df.index)
+    for field in required_fields:
+        if field not in df.columns:
+            log.warning(f"Campo obligatorio ausente en el DataFrame: {field}")
+            required_ok &= False
             continue
+        missing = df[field].isna()
+        if missing.any():
+            log.warning(f"{int(missing.sum())} filas sin valor para el campo obligatorio '{field}'.")
+        required_ok &= ~missing
 
-        try:
-            validated_model = DynamicModel.model_validate(row)
-            validated_rows.append(validated_model.model_dump())
-        except ValidationError as e:
-            log.warning(f"Errores de validación en Fila {i} (Titulo: {row.get('title')}). Anulando campos.")
-            validated_row_data = row.copy()
-            for error in e.errors():
-                try:
-                    field_name = error['loc'][0]
-                    if field_name not in required_fields:
-                        log.debug(f"Anulando campo no obligatorio: {field_name} (Error: {error['msg']})")
-                        validated_row_data[field_name] = None
-                except IndexError:
-                    log.warning(f"Error de validación genérico: {error['msg']}")
-
-            try:
-                final_validated_model = DynamicModel.model_validate(validated_row_data)
-                validated_rows.append(final_validated_model.model_dump())
-            except ValidationError as final_e:
-                log.error(f"Fila {i} descartada permanentemente tras intento de anulación. Error: {final_e}")
-                discarded_row_count += 1
-
-    final_df = pd.DataFrame(validated_rows)
+    final_df = df[required_ok].reset_index(drop=True)
+    discarded_row_count = original_count - len(final_df)
     final_count = len(final_df)
     log.info(
         f"Validación completa. Originales: {original_count}, Descartados: {discarded_row_count}, Válidos: {final_count}")
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from validation.validator import coerce_column, load_rules, validate_data  # noqa: E402
+
+RULES = {
+    'required': ['title', 'rtype_id'],
+    'types': {'title': 'str', 'rtype_id': 'int', 'classification_id': 'int', 'is_active': 'bool'},
+    'regex': {},
+}
+
+
+def test_coerce_int_nulls_non_whole_values():
+    result = coerce_column(pd.Series([1, 2.5, '3', 'x', None], dtype=object), 'int')
+    assert result.tolist() == [1, pd.NA, 3, pd.NA, pd.NA]
+
+
+def test_coerce_bool_accepts_one_and_zero():
+    result = coerce_column(pd.Series([True, False, 1, 0, 'x', None], dtype=object), 'bool')
+    assert result.tolist() == [True, False, True, False, pd.NA, pd.NA]
+
+
+def test_validate_data_nulls_optional_and_discards_required_fields():
+    df = pd.DataFrame({
+        'title': ['A', 'B', 'C'],
+        'rtype_id': [14, 2.5, 14],
+        'classification_id': [13, 13, 1.5],
+        'is_active': [True, 1, 'x'],
+    })
+    result = validate_data(df, RULES)
+    assert result['title'].tolist() == ['A', 'C']
+    assert result['classification_id'].tolist() == [13, pd.NA]
+    assert result['is_active'].tolist() == [True, pd.NA]
+
+
+def test_load_rules_returns_independent_copies():
+    config_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'validation_rules.yml')
+    rules = load_rules(config_path)
+    rules['required'].append('summary')
+    assert 'summary' not in load_rules(config_path)['required']